@@ -7,18 +7,29 @@ Monitorea múltiples fuentes: Azure DevOps, os-certificacionoperaciones, otros.
 Crea Work Items automáticamente con detalles consumidos de los mails
 """
 
-import imaplib
+import imaplib2
+import atexit
 import email
+import email.policy
 import requests
 import base64
 import time
 import json
 import os
 import re
-from email.header import decode_header
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from email.utils import parseaddr
 from urllib.parse import quote
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 from dotenv import load_dotenv
 
+try:
+    import ahocorasick
+except ImportError:
+    ahocorasick = None
+
 # Cargar configuraciones y variables
 load_dotenv()
 
@@ -32,7 +43,9 @@ config = {
     "azure_pat": os.getenv("AZURE_PAT"),
     "log_file": os.getenv("LOG_FILE", "monitor_correos.log"),
     "monitored_senders": os.getenv("MONITORED_SENDERS", "azuredevops@microsoft.com").split(","),
-    "check_interval": int(os.getenv("CHECK_INTERVAL", "60"))
+    "check_interval": int(os.getenv("CHECK_INTERVAL", "300")),
+    "azure_workers": int(os.getenv("AZURE_WORKERS", "8")),
+    "processed_uids_file": os.getenv("PROCESSED_UIDS_FILE", "processed_uids.json")
 }
 
 # Validar configuración esencial
@@ -64,6 +77,73 @@ MAPEO_REMITENTES = {
     }
 }
 
+# Mapeo de remitentes con claves en minúsculas para comparar sin recalcularlas
+MAPEO_REMITENTES_LOWER = {k.lower(): v for k, v in MAPEO_REMITENTES.items()}
+
+# Palabras clave genéricas del asunto cuando el remitente no tiene coincidencia específica
+PALABRAS_FALLO = frozenset(["failed", "failure", "error", "falló", "fallo", "fallida"])
+PALABRAS_EXITO = frozenset(["succeeded", "success", "exitoso", "completado", "exitosa"])
+PALABRAS_ADVERTENCIA = frozenset(["warning", "unstable", "advertencia", "inestable"])
+
+# Grupos de palabras genéricas en orden de prioridad (columna, tipo de evento)
+PATRONES_GENERICOS = (
+    (PALABRAS_FALLO, "Bugs creados", "failed"),
+    (PALABRAS_EXITO, "Ejecucion existosa", "success"),
+    (PALABRAS_ADVERTENCIA, "En revision", "warning")
+)
+
+
+def construir_automata_generico():
+    """Construye un autómata Aho-Corasick con las palabras genéricas (None si pyahocorasick no está instalado)"""
+    if ahocorasick is None:
+        return None
+    automata = ahocorasick.Automaton()
+    for prioridad, (palabras, columna, tipo_evento) in enumerate(PATRONES_GENERICOS):
+        for palabra in palabras:
+            automata.add_word(palabra, (prioridad, columna, tipo_evento))
+    automata.make_automaton()
+    return automata
+
+
+AUTOMATA_GENERICO = construir_automata_generico()
+
+# Tiempo de vida (segundos) de la cache de tipos y estados de Azure DevOps
+TTL_CACHE_AZURE = 300
+
+# Segundos tras los cuales se renueva la conexión IMAP para evitar cortes del proveedor
+MAX_EDAD_CONEXION_IMAP = 25 * 60
+
+# Espera (segundos) entre reintentos de conexión IMAP, duplicada en cada fallo
+ESPERA_RECONEXION_INICIAL = 5
+ESPERA_RECONEXION_MAXIMA = 300
+
+# Patrones para información (revisar para extraer datos y completar tarjetas)
+# Se aplican sobre los bytes del cuerpo para no decodificar contenido que se descarta
+PATRONES_COMPILADOS = {
+    'tiempo_ejecucion': re.compile(rb'(time|duration|tiempo|duracion)[:\s]*([0-9:\.]+)\s*(seconds|secs|minutos|minutes|ms|s)', re.IGNORECASE),
+    'error': re.compile(rb'\b(error|exception|failed|failure)\b[:\s]+([^\r\n]{1,500})', re.IGNORECASE),
+    'resultado': re.compile(rb'(result|status|estado)[:\s]*(success|failed|passed|completed|completado)', re.IGNORECASE),
+    'url_reporte': re.compile(rb'(https?://[^\s<>"]+)', re.IGNORECASE)
+}
+
+# Bytes del cuerpo sobre los que se aplican los patrones
+LIMITE_CUERPO_PATRONES = 10 * 1024
+
+# Bytes del cuerpo que se decodifican: alcanza para los 4000 caracteres que admite la descripción
+LIMITE_CUERPO_DECODIFICADO = 16 * 1024
+
+# Códigos de error de Azure DevOps que indican un valor de System.State inválido
+CODIGOS_ERROR_ESTADO = ("VS402625", "TF401320")
+
+# UIDs procesados que se acumulan antes de guardarlos en disco
+UIDS_POR_GUARDADO = 100
+
+# Intentos fallidos de crear el elemento antes de dar un correo por procesado
+MAX_INTENTOS_CREACION = 5
+
+# UID del mensaje dentro de la respuesta a UID FETCH
+PATRON_UID = re.compile(rb'UID (\d+)')
+
 # Plantillas para detalles específicos por herramienta
 PLANTILLAS_DETALLES = {
     "azuredevops@microsoft.com": {
@@ -77,20 +157,52 @@ PLANTILLAS_DETALLES = {
     }
 }
 
+# Partes fijas de la descripción de los elementos de trabajo
+ENCABEZADO_DESCRIPCION = "<h3>📧 Elemento generado automáticamente</h3>"
+PIE_DESCRIPCION = "<p><em>🔄 Creado automáticamente desde monitoreo de correo</em></p>"
+
 
 class Logger:
     """Manejador de logs"""
-    def __init__(self, archivo_log):
+    def __init__(self, archivo_log, lineas_por_flush=10):
         self.archivo_log = archivo_log
+        self.lineas_por_flush = lineas_por_flush
+        self._lineas_pendientes = 0
+        self._lock = threading.Lock()
+        # El archivo queda abierto durante toda la ejecución
+        self._archivo = open(archivo_log, "a", encoding="utf-8", buffering=1 << 16)
+        atexit.register(self.cerrar)
         
-    def registrar(self, mensaje, emoji="📝"):
+    def registrar(self, mensaje, emoji="📝", forzar=False):
         
         marca_tiempo = time.strftime("%d-%m-%Y %H:%M:%S")
         linea = f"[{marca_tiempo}] {emoji} {mensaje}"
         
-        with open(self.archivo_log, "a", encoding="utf-8") as f:
-            f.write(linea + "\n")
-        print(linea)
+        # Los hilos de creación en Azure DevOps registran en paralelo
+        with self._lock:
+            self._archivo.write(linea + "\n")
+            self._lineas_pendientes += 1
+            # Volcar a disco cada N líneas o cuando se pide explícitamente
+            if forzar or self._lineas_pendientes >= self.lineas_por_flush:
+                self._volcar()
+            print(linea)
+    
+    def _volcar(self):
+        """Escribe en disco las líneas pendientes (requiere tener el lock)"""
+        if not self._archivo.closed:
+            self._archivo.flush()
+        self._lineas_pendientes = 0
+    
+    def flush(self):
+        """Escribe en disco las líneas pendientes, por ejemplo antes de una espera larga"""
+        with self._lock:
+            self._volcar()
+    
+    def cerrar(self):
+        """Vuelca las líneas pendientes y cierra el archivo de log"""
+        with self._lock:
+            if not self._archivo.closed:
+                self._archivo.close()
 
 
 class ClienteAzureDevOps:
@@ -99,21 +211,57 @@ class ClienteAzureDevOps:
         self.org = organizacion.rstrip('/')
         self.proyecto = proyecto
         self.pat = pat
-        self.encabezados = {
-            "Authorization": "Basic " + base64.b64encode((":" + pat).encode()).decode(),
-            "Content-Type": "application/json-patch+json"
-        }
+        # URLs de la API precalculadas: organización y proyecto no cambian
+        self._proyecto_q = quote(self.proyecto)
+        self._url_base = f"{self.org}/{self._proyecto_q}/_apis/wit"
+        self._url_tipos = f"{self._url_base}/workitemtypes?api-version=6.0"
+        self._url_estados_tpl = f"{self._url_base}/workitemtypes/{{}}/states?api-version=6.0"
+        self._url_crear_tpl = f"{self._url_base}/workitems/${{}}?api-version=6.0"
+        self._auth_header = "Basic " + base64.b64encode((":" + pat).encode()).decode()
+        # Sesión reutilizable: mantiene las conexiones TLS abiertas entre llamadas
+        self.session = requests.Session()
+        self.session.headers["Authorization"] = self._auth_header
+        self.session.headers["Content-Type"] = "application/json-patch+json"
+        reintentos = Retry(total=3, backoff_factor=0.5, status_forcelist=[429, 500, 502, 503, 504])
+        self.session.mount("https://", HTTPAdapter(pool_connections=4, pool_maxsize=16, max_retries=reintentos))
+        # Caches con marca de tiempo: (momento, valor)
+        self._cache_tipos = None
+        self._cache_estados = {}
+        # Estado válido ya resuelto para cada (tipo de elemento, estado mapeado) rechazado por Azure
+        self._estados_resueltos = {}
+    
+    def _cache_vigente(self, entrada):
+        """Indica si una entrada de cache sigue dentro del TTL"""
+        return entrada is not None and time.monotonic() - entrada[0] < TTL_CACHE_AZURE
+    
+    def invalidar_cache(self, tipo_elemento=None):
+        """Descarta los tipos y estados cacheados para forzar una nueva consulta"""
+        self._cache_tipos = None
+        if tipo_elemento is None:
+            self._cache_estados.clear()
+            self._estados_resueltos.clear()
+        else:
+            self._invalidar_estados(tipo_elemento)
+    
+    def _invalidar_estados(self, tipo_elemento):
+        """Descarta los estados cacheados y resueltos de un tipo de elemento"""
+        self._cache_estados.pop(tipo_elemento, None)
+        for clave in list(self._estados_resueltos):
+            if clave[0] == tipo_elemento:
+                self._estados_resueltos.pop(clave, None)
     
     def obtener_tipos_elementos(self):
         """Obtiene los tipos de elementos de trabajo disponibles"""
+        if self._cache_vigente(self._cache_tipos):
+            return self._cache_tipos[1]
         try:
-            proyecto_codificado = quote(self.proyecto)
-            url = f"{self.org}/{proyecto_codificado}/_apis/wit/workitemtypes?api-version=6.0"
+            url = self._url_tipos
             
-            respuesta = requests.get(url, headers=self.encabezados, timeout=30)
+            respuesta = self.session.get(url, timeout=30)
             
             if respuesta.status_code == 200:
                 tipos = [tipo['name'] for tipo in respuesta.json()['value']]
+                self._cache_tipos = (time.monotonic(), tipos)
                 return tipos
             return ["Issue", "Task"] 
         except Exception as error:
@@ -122,14 +270,17 @@ class ClienteAzureDevOps:
     
     def obtener_estados_elemento(self, tipo_elemento):
         """Obtiene los estados disponibles para un tipo de elemento"""
+        entrada = self._cache_estados.get(tipo_elemento)
+        if self._cache_vigente(entrada):
+            return entrada[1]
         try:
-            proyecto_codificado = quote(self.proyecto)
-            url = f"{self.org}/{proyecto_codificado}/_apis/wit/workitemtypes/{tipo_elemento}/states?api-version=6.0"
+            url = self._url_estados_tpl.format(tipo_elemento)
             
-            respuesta = requests.get(url, headers=self.encabezados, timeout=30)
+            respuesta = self.session.get(url, timeout=30)
             
             if respuesta.status_code == 200:
                 estados = [estado['name'] for estado in respuesta.json()['value']]
+                self._cache_estados[tipo_elemento] = (time.monotonic(), estados)
                 # print(f"🎯 Estados REALES para '{tipo_elemento}': {estados}") 
                 return estados
             return ["To Do", "Doing", "Done"]
@@ -142,37 +293,41 @@ class ClienteAzureDevOps:
         detalles = {}
         
         try:
-            # Obtener el cuerpo mail
-            cuerpo = ""
+            # Obtener el cuerpo mail sin decodificar
+            cuerpo_bytes = b""
             if mensaje.is_multipart():
-                for part in mensaje.walk():
-                    content_type = part.get_content_type()
-                    content_disposition = str(part.get("Content-Disposition"))
-                    
-                    if content_type == "text/plain" and "attachment" not in content_disposition:
-                        cuerpo = part.get_payload(decode=True).decode(errors='ignore')
-                        break
+                # get_body se detiene en la primera parte text/plain que no sea adjunto
+                parte_texto = mensaje.get_body(preferencelist=('plain',))
+                if parte_texto is not None:
+                    cuerpo_bytes = parte_texto.get_payload(decode=True) or b""
+                else:
+                    # get_body no entra en message/rfc822 ni sale de la parte inicial de
+                    # multipart/related: recorrer todo el árbol en esos casos
+                    for part in mensaje.walk():
+                        content_type = part.get_content_type()
+                        content_disposition = str(part.get("Content-Disposition"))
+                        
+                        if content_type == "text/plain" and "attachment" not in content_disposition:
+                            cuerpo_bytes = part.get_payload(decode=True) or b""
+                            break
             else:
-                cuerpo = mensaje.get_payload(decode=True).decode(errors='ignore')
+                cuerpo_bytes = mensaje.get_payload(decode=True) or b""
             
+            # Decodificar solo la parte del cuerpo que se muestra en la descripción
+            cuerpo = cuerpo_bytes[:LIMITE_CUERPO_DECODIFICADO].decode(errors='ignore')
             detalles['cuerpo_completo'] = cuerpo
             detalles['body'] = cuerpo  
 
             # Extraer información para detalle
             detalles['cuerpo_preview'] = cuerpo[:1000] + "..." if len(cuerpo) > 1000 else cuerpo
             
-            # Patrones para información (revisar para extraer datos y completar tarjetas)
-            patrones = {
-                'tiempo_ejecucion': r'(time|duration|tiempo|duracion)[:\s]*([0-9:\.]+)\s*(seconds|secs|minutos|minutes|ms|s)',
-                'error': r'(error|exception|failed|failure)[:\s]*(.+)',
-                'resultado': r'(result|status|estado)[:\s]*(success|failed|passed|completed|completado)',
-                'url_reporte': r'(https?://[^\s<>"]+|www\.[^\s<>"]+)'
-            }
-            
-            for clave, patron in patrones.items():
-                coincidencias = re.findall(patron, cuerpo, re.IGNORECASE)
-                if coincidencias:
-                    detalles[clave] = coincidencias[0] if isinstance(coincidencias[0], str) else ' '.join(coincidencias[0])
+            # Acotar el texto analizado para que un correo enorme no bloquee el proceso
+            cuerpo_patrones = cuerpo_bytes[:LIMITE_CUERPO_PATRONES]
+            for clave, patron in PATRONES_COMPILADOS.items():
+                # Solo interesa la primera coincidencia: search se detiene al encontrarla
+                coincidencia = patron.search(cuerpo_patrones)
+                if coincidencia:
+                    detalles[clave] = b' '.join(coincidencia.groups()).decode(errors='ignore')
             
             return detalles
             
@@ -183,28 +338,21 @@ class ClienteAzureDevOps:
     def crear_elemento_trabajo(self, titulo, tipo_elemento, columna_destino, detalles=None, remitente=""):
         """Crea un nuevo elemento de trabajo en Azure DevOps con detalles"""
         try:
-            proyecto_codificado = quote(self.proyecto)
-            url = f"{self.org}/{proyecto_codificado}/_apis/wit/workitems/${tipo_elemento}?api-version=6.0"
-            
-            # Determinar estado según la columna destino
-            estado = MAPEO_TABLERO["columnas_estados"].get(columna_destino, "To Do")
+            url = self._url_crear_tpl.format(tipo_elemento)
             
-            # Verificar que el estado existe para este tipo de elemento
-            estados_disponibles = self.obtener_estados_elemento(tipo_elemento)
-            if estado not in estados_disponibles:
-                print(f"⚠️ Estado '{estado}' no disponible para {tipo_elemento}. Estados disponibles: {estados_disponibles}")
-                # Usar el primer estado disponible por defecto
-                estado = estados_disponibles[0] if estados_disponibles else "To Do"
-                print(f"⚠️ Usando estado por defecto: {estado}")
+            # Determinar estado según la columna destino (o el ya resuelto para este tipo)
+            estado_mapeado = MAPEO_TABLERO["columnas_estados"].get(columna_destino, "To Do")
+            estado = self._estados_resueltos.get((tipo_elemento, estado_mapeado), estado_mapeado)
             
             # Construir descripción con detalles
             descripcion = self._construir_descripcion(columna_destino, detalles, remitente)
             
             # Datos para crear el elemento
+            operacion_estado = {"op": "add", "path": "/fields/System.State", "value": estado}
             datos = [
                 {"op": "add", "path": "/fields/System.Title", "value": titulo},
                 {"op": "add", "path": "/fields/System.Description", "value": descripcion},
-                {"op": "add", "path": "/fields/System.State", "value": estado},
+                operacion_estado,
                 {"op": "add", "path": "/fields/System.Tags", "value": "Auto-Generado"}
             ]
             
@@ -216,7 +364,25 @@ class ClienteAzureDevOps:
                     "value": f"Se genera tarjeta por ejecucion reportada desde: {remitente}"
                 })
             
-            respuesta = requests.post(url, headers=self.encabezados, json=datos, timeout=30)
+            respuesta = self.session.post(url, json=datos, timeout=30)
+            
+            # El estado solo se valida si Azure lo rechaza, para ahorrar la consulta en el caso habitual
+            if respuesta.status_code == 400 and self._es_error_estado(respuesta.text):
+                # Primero con los estados cacheados; si dicen que el estado es válido, están desactualizados
+                estado_alternativo = self._estado_alternativo(tipo_elemento, estado)
+                if estado_alternativo is None:
+                    self._invalidar_estados(tipo_elemento)
+                    estado_alternativo = self._estado_alternativo(tipo_elemento, estado)
+                
+                if estado_alternativo is not None:
+                    estado = estado_alternativo
+                    operacion_estado["value"] = estado
+                    respuesta = self.session.post(url, json=datos, timeout=30)
+                    if respuesta.status_code in [200, 201]:
+                        self._estados_resueltos[(tipo_elemento, estado_mapeado)] = estado
+                    elif respuesta.status_code == 400 and self._es_error_estado(respuesta.text):
+                        # También rechazado: refrescar los estados en la próxima consulta
+                        self._invalidar_estados(tipo_elemento)
             
             if respuesta.status_code in [200, 201]:
                 id_elemento = respuesta.json().get('id', 'N/A')
@@ -224,172 +390,413 @@ class ClienteAzureDevOps:
                 return True, id_elemento, url_elemento, estado
             else:
                 print(f"Error API: {respuesta.status_code} - {respuesta.text}")
+                # Tipos o estados desactualizados: descartar la cache para la próxima consulta
+                if respuesta.status_code in [404, 409]:
+                    self.invalidar_cache(tipo_elemento)
                 return False, None, None, None
                 
         except Exception as error:
             print(f"Error creando elemento: {error}")
             return False, None, None, None
     
+    def _estado_alternativo(self, tipo_elemento, estado):
+        """Devuelve el estado a usar si 'estado' no está disponible para el tipo, o None si lo está"""
+        estados_disponibles = self.obtener_estados_elemento(tipo_elemento)
+        if estado in estados_disponibles:
+            return None
+        print(f"⚠️ Estado '{estado}' no disponible para {tipo_elemento}. Estados disponibles: {estados_disponibles}")
+        # Usar el primer estado disponible por defecto
+        estado_por_defecto = estados_disponibles[0] if estados_disponibles else "To Do"
+        print(f"⚠️ Usando estado por defecto: {estado_por_defecto}")
+        return estado_por_defecto
+    
+    def _es_error_estado(self, texto_respuesta):
+        """Indica si el error de la API se debe a un estado inválido para el tipo de elemento"""
+        return "System.State" in texto_respuesta or any(codigo in texto_respuesta for codigo in CODIGOS_ERROR_ESTADO)
+    
     def _construir_descripcion(self, columna_destino, detalles, remitente):
         """Construye la descripción según el tipo de elemento"""
-        descripcion = f"<h3>📧 Elemento generado automáticamente</h3>"
-        descripcion += f"<p><strong>Remitente:</strong> {remitente}</p>"
+        partes = [ENCABEZADO_DESCRIPCION, f"<p><strong>Remitente:</strong> {remitente}</p>"]
         
         if columna_destino == "Bugs creados":
-            descripcion += self._descripcion_error(detalles)
+            partes.append(self._descripcion_error(detalles))
         elif columna_destino == "Ejecucion existosa":
-            descripcion += self._descripcion_exitosa(detalles)
+            partes.append(self._descripcion_exitosa(detalles))
         elif columna_destino == "En revision":
-            descripcion += self._descripcion_advertencia(detalles)
+            partes.append(self._descripcion_advertencia(detalles))
         else:
-            descripcion += "<p>Notificación de sistema CI/CD</p>"
+            partes.append("<p>Notificación de sistema CI/CD</p>")
                 
-        descripcion += "<p><em>🔄 Creado automáticamente desde monitoreo de correo</em></p>"
-        return descripcion
+        partes.append(PIE_DESCRIPCION)
+        return "".join(partes)
     
     def _descripcion_error(self, detalles):
         
         """Construye descripción para errores"""
-        descripcion = "<h3>🚨 Error en Ejecución</h3>"
-        descripcion += "<p>Se ha detectado un error durante la ejecución.</p>"
+        partes = [
+            "<h3>🚨 Error en Ejecución</h3>",
+            "<p>Se ha detectado un error durante la ejecución.</p>"
+        ]
         
         if detalles:
-            descripcion += "<h4>🔍 Detalles del error:</h4>"
-            descripcion += "<ul>"
+            partes.append("<h4>🔍 Detalles del error:</h4>")
+            partes.append("<ul>")
             
             if 'error' in detalles:
-                descripcion += f"<li><strong>Error:</strong> {detalles['error']}</li>"
+                partes.append(f"<li><strong>Error:</strong> {detalles['error']}</li>")
             
             if 'tiempo_ejecucion' in detalles:
-                descripcion += f"<li><strong>Tiempo de ejecución:</strong> {detalles['tiempo_ejecucion']}</li>"
+                partes.append(f"<li><strong>Tiempo de ejecución:</strong> {detalles['tiempo_ejecucion']}</li>")
 
-            descripcion += "</ul>"
+            partes.append("</ul>")
             
             cuerpo = detalles.get('cuerpo_completo', detalles.get('body', ''))
             if cuerpo:
                 if len(cuerpo) > 4000:
                     cuerpo = cuerpo[:4000] + "... [CONTENIDO RECORTADO POR LÍMITE DE AZURE DEVOPS]"
             
-            descripcion += "<h4>📧 Cuerpo completo del correo:</h4>"
-            descripcion += f"<pre>{cuerpo}</pre>"
+            partes.append("<h4>📧 Cuerpo completo del correo:</h4>")
+            partes.append(f"<pre>{cuerpo}</pre>")
         
-        return descripcion
+        return "".join(partes)
     
     def _descripcion_exitosa(self, detalles):
         """Construye descripción para ejecuciones exitosas"""
-        descripcion = "<h3>✅ Ejecución Exitosa</h3>"
-        descripcion += "<p>La ejecución se ha completado sin errores.</p>"
+        partes = [
+            "<h3>✅ Ejecución Exitosa</h3>",
+            "<p>La ejecución se ha completado sin errores.</p>"
+        ]
         
         if detalles:
-            descripcion += "<h4>📊 Métricas de ejecución:</h4>"
-            descripcion += "<ul>"
+            partes.append("<h4>📊 Métricas de ejecución:</h4>")
+            partes.append("<ul>")
             
             if 'tiempo_ejecucion' in detalles:
-                descripcion += f"<li><strong>Tiempo de ejecución:</strong> {detalles['tiempo_ejecucion']}</li>"
+                partes.append(f"<li><strong>Tiempo de ejecución:</strong> {detalles['tiempo_ejecucion']}</li>")
             
             if 'resultado' in detalles:
-                descripcion += f"<li><strong>Resultado:</strong> {detalles['resultado']}</li>"
+                partes.append(f"<li><strong>Resultado:</strong> {detalles['resultado']}</li>")
             
             if 'url_reporte' in detalles:
-                descripcion += f"<li><strong>Reporte:</strong> <a href='{detalles['url_reporte']}'>Ver reporte</a></li>"
+                partes.append(f"<li><strong>Reporte:</strong> <a href='{detalles['url_reporte']}'>Ver reporte</a></li>")
             
-            descripcion += "</ul>"
+            partes.append("</ul>")
 
             cuerpo = detalles.get('cuerpo_completo', detalles.get('body', ''))
             if cuerpo:
                 if len(cuerpo) > 4000:
                     cuerpo = cuerpo[:4000] + "... [CONTENIDO RECORTADO POR LÍMITE DE AZURE DEVOPS]"
             
-            descripcion += "<h4>Cuerpo completo del correo:</h4>"
-            descripcion += f"<pre>{cuerpo}</pre>"
+            partes.append("<h4>Cuerpo completo del correo:</h4>")
+            partes.append(f"<pre>{cuerpo}</pre>")
         
-        return descripcion
+        return "".join(partes)
     
     def _descripcion_advertencia(self, detalles):
         """Construye descripción para advertencias"""
-        descripcion = "<h3>⚠️ Ejecución con Advertencias</h3>"
-        descripcion += "<p>La ejecución se completó pero con advertencias que requieren revisión.</p>"
+        partes = [
+            "<h3>⚠️ Ejecución con Advertencias</h3>",
+            "<p>La ejecución se completó pero con advertencias que requieren revisión.</p>"
+        ]
         
         if detalles:
-            descripcion += "<h4>📝 Detalles:</h4>"
-            descripcion += "<ul>"
+            partes.append("<h4>📝 Detalles:</h4>")
+            partes.append("<ul>")
             
             if 'error' in detalles:
-                descripcion += f"<li><strong>Advertencia:</strong> {detalles['error']}</li>"
+                partes.append(f"<li><strong>Advertencia:</strong> {detalles['error']}</li>")
             
             if 'tiempo_ejecucion' in detalles:
-                descripcion += f"<li><strong>Tiempo de ejecución:</strong> {detalles['tiempo_ejecucion']}</li>"
+                partes.append(f"<li><strong>Tiempo de ejecución:</strong> {detalles['tiempo_ejecucion']}</li>")
             
-            descripcion += "</ul>"
+            partes.append("</ul>")
         
-        return descripcion
+        return "".join(partes)
 
 
 class ProcesadorCorreos:
     """Procesa correos electrónicos y extrae información relevante"""
-    def __init__(self, servidor, usuario, contraseña):
+    def __init__(self, servidor, usuario, contraseña, archivo_uids):
         self.servidor = servidor
         self.usuario = usuario
         self.contraseña = contraseña
+        self.archivo_uids = archivo_uids
+        # Los UIDs solo son válidos para esta cuenta y un mismo UIDVALIDITY del buzón
+        self._cuenta = f"{usuario}@{servidor}"
+        self._uidvalidity = None
+        self._uids_procesados = self._cargar_uids_procesados()
+        self._intentos_fallidos = {}
+        self._uids_sin_guardar = 0
+        self._cliente_imap = None
+        self._conectado_en = 0
+        self._soporta_idle = False
+        self._espera_reconexion = ESPERA_RECONEXION_INICIAL
     
     def conectar(self):
         """Establece conexión con el servidor IMAP"""
+        cliente = None
         try:
-            cliente = imaplib.IMAP4_SSL(self.servidor)
+            cliente = imaplib2.IMAP4_SSL(self.servidor)
             cliente.login(self.usuario, self.contraseña)
             cliente.select("inbox")
             return cliente
         except Exception as error:
             print(f"Error conectando al servidor: {error}")
+            if cliente is not None:
+                self._descartar_cliente(cliente)
             return None
     
+    def _descartar_cliente(self, cliente):
+        """Cierra una conexión descartada: imaplib2 solo detiene sus hilos con logout()"""
+        try:
+            cliente.logout()
+        except Exception as error:
+            print(f"Error cerrando conexión IMAP descartada: {error}")
+    
+    def obtener_cliente(self):
+        """Devuelve la conexión IMAP persistente, reconectando si se perdió o expiró"""
+        if self._cliente_imap is not None:
+            if time.monotonic() - self._conectado_en > MAX_EDAD_CONEXION_IMAP:
+                self.cerrar()
+            else:
+                try:
+                    estado, _ = self._cliente_imap.noop()
+                    if estado == "OK":
+                        return self._cliente_imap
+                except (imaplib2.IMAP4.abort, imaplib2.IMAP4.error, OSError) as error:
+                    print(f"Conexión IMAP perdida: {error}")
+                # Descartar la conexión para que se vuelva a abrir
+                self._descartar_cliente(self._cliente_imap)
+                self._cliente_imap = None
+        
+        self._cliente_imap = self.conectar()
+        self._conectado_en = time.monotonic()
+        if self._cliente_imap is not None:
+            self._verificar_uidvalidity(self._cliente_imap)
+            self._soporta_idle = "IDLE" in self._cliente_imap.capabilities
+            self._espera_reconexion = ESPERA_RECONEXION_INICIAL
+        return self._cliente_imap
+    
+    def siguiente_espera_reconexion(self):
+        """Devuelve la espera antes de reintentar la conexión con backoff exponencial"""
+        espera = self._espera_reconexion
+        self._espera_reconexion = min(espera * 2, ESPERA_RECONEXION_MAXIMA)
+        return espera
+    
+    def esperar_novedades(self, segundos):
+        """Espera correo nuevo con IMAP IDLE o, si el servidor no lo soporta, durante el intervalo"""
+        if self._cliente_imap is None or not self._soporta_idle:
+            time.sleep(segundos)
+            return
+        
+        try:
+            # Bloquea hasta que el servidor avise de cambios en el buzón o venza el timeout
+            estado, _ = self._cliente_imap.idle(timeout=segundos)
+            if estado != "OK":
+                print(f"El servidor rechazó IDLE ({estado}). Se usará consulta periódica")
+                self._soporta_idle = False
+        except imaplib2.IMAP4.abort as error:
+            print(f"Conexión IMAP perdida durante IDLE: {error}")
+            self._descartar_cliente(self._cliente_imap)
+            self._cliente_imap = None
+        except imaplib2.IMAP4.error as error:
+            print(f"El servidor rechazó IDLE: {error}. Se usará consulta periódica")
+            self._soporta_idle = False
+            time.sleep(segundos)
+    
+    def cerrar(self):
+        """Cierra la conexión IMAP persistente si existe"""
+        if self._cliente_imap is None:
+            return
+        try:
+            self._cliente_imap.close()
+        except Exception as error:
+            print(f"Error cerrando conexión IMAP: {error}")
+        finally:
+            self._descartar_cliente(self._cliente_imap)
+            self._cliente_imap = None
+    
+    def _cargar_uids_procesados(self):
+        """Carga los UIDs de correos ya procesados en ejecuciones anteriores para esta cuenta"""
+        try:
+            with open(self.archivo_uids, encoding="utf-8") as f:
+                datos = json.load(f)
+        except FileNotFoundError:
+            return set()
+        except (OSError, ValueError) as error:
+            print(f"Error cargando UIDs procesados: {error}")
+            return set()
+        
+        if not isinstance(datos, dict) or not isinstance(datos.get("uids"), list):
+            print(f"Formato inválido en {self.archivo_uids}. Se descartan los UIDs procesados")
+            return set()
+        if datos.get("cuenta") != self._cuenta:
+            print(f"{self.archivo_uids} corresponde a otra cuenta. Se descartan los UIDs procesados")
+            return set()
+        
+        uids = {str(uid) for uid in datos["uids"] if str(uid).isascii() and str(uid).isdigit()}
+        descartados = sum(1 for uid in datos["uids"] if str(uid) not in uids)
+        if descartados:
+            print(f"Se descartaron {descartados} UIDs inválidos de {self.archivo_uids}")
+        self._uidvalidity = datos.get("uidvalidity")
+        return uids
+    
+    def _verificar_uidvalidity(self, cliente):
+        """Descarta los UIDs procesados si el UIDVALIDITY del buzón cambió"""
+        try:
+            _, datos = cliente.response("UIDVALIDITY")
+        except Exception as error:
+            print(f"Error obteniendo UIDVALIDITY: {error}")
+            return
+        if not datos or datos[0] is None:
+            print("El servidor no informó UIDVALIDITY. Se conservan los UIDs procesados")
+            return
+        
+        uidvalidity = datos[0].decode() if isinstance(datos[0], bytes) else str(datos[0])
+        if uidvalidity == self._uidvalidity:
+            return
+        if self._uids_procesados:
+            print(f"UIDVALIDITY cambió ({self._uidvalidity} → {uidvalidity}). Se descartan los UIDs procesados")
+            self._uids_procesados.clear()
+        self._uidvalidity = uidvalidity
+        self.guardar_uids_procesados()
+    
+    def guardar_uids_procesados(self):
+        """Guarda los UIDs procesados reemplazando el archivo de forma atómica"""
+        temporal = self.archivo_uids + ".tmp"
+        try:
+            with open(temporal, "w", encoding="utf-8") as f:
+                json.dump({
+                    "cuenta": self._cuenta,
+                    "uidvalidity": self._uidvalidity,
+                    "uids": sorted(self._uids_procesados, key=int)
+                }, f)
+            os.replace(temporal, self.archivo_uids)
+            self._uids_sin_guardar = 0
+        except OSError as error:
+            print(f"Error guardando UIDs procesados: {error}")
+    
+    def marcar_procesado(self, cliente, uid):
+        """Registra el UID como procesado y marca el correo como leído"""
+        # Registrar antes del STORE: si la conexión falla el correo no se vuelve a procesar
+        self._intentos_fallidos.pop(uid, None)
+        self._uids_procesados.add(uid.decode())
+        self._uids_sin_guardar += 1
+        marcado = self._marcar_leidos(cliente, [uid])
+        # Si el correo sigue sin leer, solo el archivo evita reprocesarlo tras un reinicio
+        if not marcado or self._uids_sin_guardar >= UIDS_POR_GUARDADO:
+            self.guardar_uids_procesados()
+        return marcado
+    
+    def registrar_fallo(self, cliente, uid):
+        """Cuenta un intento fallido; tras MAX_INTENTOS_CREACION marca el correo como procesado y devuelve True"""
+        intentos = self._intentos_fallidos.get(uid, 0) + 1
+        if intentos < MAX_INTENTOS_CREACION:
+            self._intentos_fallidos[uid] = intentos
+            return False
+        self._intentos_fallidos.pop(uid, None)
+        self.marcar_procesado(cliente, uid)
+        return True
+    
+    def _marcar_leidos(self, cliente, uids):
+        """Marca los correos como leídos sin propagar errores de la conexión IMAP"""
+        try:
+            estado, _ = cliente.uid("STORE", b",".join(uids), "+FLAGS", "\\Seen")
+            return estado == "OK"
+        except Exception as error:
+            print(f"Error marcando como leídos los correos {b','.join(uids).decode()}: {error}")
+            return False
+    
     def buscar_correos_monitoreados(self, cliente, remitentes):
-        """Busca correos no leídos de múltiples remitentes monitoreados"""
+        """Busca correos no leídos de múltiples remitentes monitoreados y devuelve sus UIDs"""
         try:
-            todos_correos = []
-            
-            for remitente in remitentes:
-                remitente_limpio = remitente.strip()
-                if not remitente_limpio:
-                    continue
-                    
-                criterio = f'(UNSEEN FROM "{remitente_limpio}")'
-                estado, mensajes = cliente.search(None, criterio)
-                
-                if estado == "OK" and mensajes[0]:
-                    correos_remitente = mensajes[0].split()
-                    todos_correos.extend([(msg_id, remitente_limpio) for msg_id in correos_remitente])
-            
-            return todos_correos
+            remitentes_limpios = [r.strip() for r in remitentes if r.strip()]
+            if not remitentes_limpios:
+                return []
+            
+            # Un único SEARCH con los remitentes combinados por OR
+            estado, mensajes = cliente.uid("SEARCH", self._criterio_busqueda(remitentes_limpios))
+            if estado != "OK" or not mensajes[0]:
+                return []
+            # Descartar los correos ya procesados antes de descargarlos
+            return [uid for uid in mensajes[0].split() if uid.decode() not in self._uids_procesados]
         except Exception as error:
             print(f"Error buscando correos: {error}")
             return []
     
+    def _criterio_busqueda(self, remitentes):
+        """Arma el criterio IMAP (UNSEEN (OR ... FROM)) para todos los remitentes"""
+        criterio = f'FROM "{remitentes[0]}"'
+        for remitente in remitentes[1:]:
+            criterio = f'OR ({criterio}) FROM "{remitente}"'
+        return f'(UNSEEN {criterio})'
+    
+    def remitente_monitoreado(self, mensaje, remitentes):
+        """Devuelve el remitente monitoreado que coincide con el encabezado From del correo"""
+        remitentes_limpios = [r.strip() for r in remitentes if r.strip()]
+        if len(remitentes_limpios) == 1:
+            return remitentes_limpios[0]
+        
+        # El From ya viene en el correo descargado: no hace falta otro FETCH de encabezados
+        remitente_correo = str(mensaje["from"] or "")
+        remitente_lower = remitente_correo.lower()
+        for remitente in remitentes_limpios:
+            if remitente.lower() in remitente_lower:
+                return remitente
+        return parseaddr(remitente_correo)[1] or remitente_correo
+    
+    def _fetch_por_lotes(self, cliente, ids, consulta, batch_size=100):
+        """Ejecuta UID FETCH por lotes y devuelve pares (uid, contenido)"""
+        resultados = []
+        for inicio in range(0, len(ids), batch_size):
+            lote = ids[inicio:inicio + batch_size]
+            try:
+                estado, datos = cliente.uid("FETCH", b",".join(lote), consulta)
+            except Exception as error:
+                print(f"Error descargando lote de correos: {error}")
+                continue
+            if estado != "OK":
+                continue
+
+            # La respuesta intercala tuplas (encabezado, contenido) con cierres b")"
+            for indice, parte in enumerate(datos):
+                if isinstance(parte, tuple) and len(parte) == 2:
+                    coincidencia = PATRON_UID.search(parte[0])
+                    siguiente = datos[indice + 1] if indice + 1 < len(datos) else None
+                    if not coincidencia and isinstance(siguiente, bytes):
+                        # Algunos servidores (Exchange/Office 365) envían el UID después del contenido
+                        coincidencia = PATRON_UID.search(siguiente)
+                    if coincidencia:
+                        resultados.append((coincidencia.group(1), parte[1]))
+                    else:
+                        print(f"Respuesta FETCH sin UID: {parte[0][:80]!r}")
+        return resultados
+    
+    def fetch_en_lote(self, cliente, ids, batch_size=100):
+        """Descarga varios correos con un FETCH por lote en lugar de uno por mensaje"""
+        # BODY.PEEK no marca los correos como leídos: eso ocurre recién al procesarlos con éxito
+        return {
+            id_mensaje: email.message_from_bytes(contenido, policy=email.policy.default)
+            for id_mensaje, contenido in self._fetch_por_lotes(cliente, ids, "(BODY.PEEK[])", batch_size)
+        }
+
     def decodificar_asunto(self, asunto_codificado):
         """Decodifica el asunto del mail"""
-        try:
-            partes_decodificadas = decode_header(asunto_codificado)
-            asunto = ""
-            for parte, codificacion in partes_decodificadas:
-                if isinstance(parte, bytes):
-                    asunto += parte.decode(codificacion if codificacion else 'utf-8', errors='ignore')
-                else:
-                    asunto += parte
-            return asunto
-        except:
-            return str(asunto_codificado)
+        # Con email.policy.default el encabezado ya llega decodificado (los bytes inválidos se reemplazan)
+        return str(asunto_codificado or "")
     
     def determinar_accion_por_remitente(self, asunto, remitente):
         """Determina la accion segun el remitente y el asunto"""
         asunto_lower = asunto.lower()
         remitente_limpio = remitente.strip().lower()
         
-        # Buscar mapeo por remitente
-        mapeo_remitente = None
-        for remitente_mapeo in MAPEO_REMITENTES:
-            if remitente_mapeo.lower() in remitente_limpio:
-                mapeo_remitente = MAPEO_REMITENTES[remitente_mapeo]
-                break
+        # Buscar mapeo por remitente: coincidencia exacta y, si no, parcial
+        mapeo_remitente = MAPEO_REMITENTES_LOWER.get(remitente_limpio)
+        if not mapeo_remitente:
+            for remitente_mapeo, mapeo in MAPEO_REMITENTES_LOWER.items():
+                if remitente_mapeo in remitente_limpio:
+                    mapeo_remitente = mapeo
+                    break
         
         # Si no hay mapeo específico, usar mapeo por defecto
         if not mapeo_remitente:
@@ -401,50 +808,37 @@ class ProcesadorCorreos:
                 return columna, patron
                 
         # Patrones genéricos si no hay coincidencia específica
-        if any(p in asunto_lower for p in ["failed", "failure", "error", "falló", "fallo", "fallida"]):
-            return "Bugs creados", "failed"
-        elif any(p in asunto_lower for p in ["succeeded", "success", "exitoso", "completado", "exitosa"]):
-            return "Ejecucion existosa", "success"
-        elif any(p in asunto_lower for p in ["warning", "unstable", "advertencia", "inestable"]):
-            return "En revision", "warning"
+        if AUTOMATA_GENERICO is not None:
+            # Una sola pasada sobre el asunto; ante varias coincidencias gana el grupo prioritario
+            coincidencia = min((valor for _, valor in AUTOMATA_GENERICO.iter(asunto_lower)), default=None)
+            if coincidencia:
+                return coincidencia[1], coincidencia[2]
+            return None, None
+        
+        for palabras, columna, tipo_evento in PATRONES_GENERICOS:
+            if any(p in asunto_lower for p in palabras):
+                return columna, tipo_evento
             
         return None, None
 
-    def procesar_correo(self, cliente, id_mensaje, remitente, cliente_azure, logger):
-        """Procesa un correo individual considerando el remitente"""
+    def procesar_correo(self, cliente, id_mensaje, mensaje, remitente, cliente_azure, logger):
+        """Procesa un correo individual y devuelve los datos del elemento a crear, o None si no requiere acción"""
         try:
-            estado, datos = cliente.fetch(id_mensaje, "(RFC822)")
-            if estado != "OK":
-                return
-            
-            mensaje = email.message_from_bytes(datos[0][1])
             asunto = self.decodificar_asunto(mensaje["subject"])
             
             logger.registrar(f"Procesando correo de {remitente}: {asunto}", "📧")
             
-            # Extraer detalles del correo
-            detalles = cliente_azure.extraer_detalles_correo(mensaje)
-            detalles['remitente'] = remitente
-            
-            # Marcar como leído
-            cliente.store(id_mensaje, '+FLAGS', '\\Seen')
-            
             # Determinar acción basada en remitente y asunto
             columna, tipo_evento = self.determinar_accion_por_remitente(asunto, remitente)
             
             if not columna:
                 logger.registrar(f"Correo de {remitente} no requiere acción: {asunto}", "📨")
-                return
-            
-            # Determinar tipo de elemento
-            tipos_disponibles = cliente_azure.obtener_tipos_elementos()
+                self.marcar_procesado(cliente, id_mensaje)
+                return None
             
-            tipo_elemento = "Issue"
-            
-            # Verificar que el tipo seleccionado existe
-            if tipo_elemento not in tipos_disponibles:
-                logger.registrar(f"⚠️ Tipo {tipo_elemento} no disponible. Usando primer tipo disponible", "⚠️")
-                tipo_elemento = tipos_disponibles[0] if tipos_disponibles else "Issue"
+            # Extraer detalles del correo solo si se va a crear un elemento
+            detalles = cliente_azure.extraer_detalles_correo(mensaje)
+            detalles['remitente'] = remitente
             
             # Crear título apropiado
             titulo_prefijo = PLANTILLAS_DETALLES.get(remitente, {}).get(tipo_evento, "")
@@ -458,21 +852,51 @@ class ProcesadorCorreos:
             
             titulo = f"{titulo_prefijo}: {asunto[:100]}{'...' if len(asunto) > 100 else ''}"
             
+            return {
+                "id_mensaje": id_mensaje,
+                "titulo": titulo,
+                "columna": columna,
+                "tipo_evento": tipo_evento,
+                "detalles": detalles,
+                "remitente": remitente
+            }
+                
+        except Exception as error:
+            logger.registrar(f"Error procesando correo de {remitente}: {error}", "❌", forzar=True)
+            return None
+    
+    def crear_elemento_correo(self, pendiente, cliente_azure, logger):
+        """Crea en Azure DevOps el elemento de trabajo de un correo ya procesado"""
+        remitente = pendiente["remitente"]
+        columna = pendiente["columna"]
+        try:
+            # Determinar tipo de elemento
+            tipos_disponibles = cliente_azure.obtener_tipos_elementos()
+            
+            tipo_elemento = "Issue"
+            
+            # Verificar que el tipo seleccionado existe
+            if tipo_elemento not in tipos_disponibles:
+                logger.registrar(f"⚠️ Tipo {tipo_elemento} no disponible. Usando primer tipo disponible", "⚠️", forzar=True)
+                tipo_elemento = tipos_disponibles[0] if tipos_disponibles else "Issue"
+            
             # Crear workItem con detalles
             exito, id_elemento, url, estado = cliente_azure.crear_elemento_trabajo(
-                titulo, tipo_elemento, columna, detalles, remitente
+                pendiente["titulo"], tipo_elemento, columna, pendiente["detalles"], remitente
             )
             
             if exito:
                 logger.registrar(f"Elemento #{id_elemento} creado en '{columna}'", "✅")
                 logger.registrar(f"Remitente: {remitente}", "👤")
-                logger.registrar(f"Tipo evento: {tipo_evento}", "🎯")
+                logger.registrar(f"Tipo evento: {pendiente['tipo_evento']}", "🎯")
                 logger.registrar(f"URL: {url}", "🔗")
             else:
-                logger.registrar("No se pudo crear el elemento", "❌")
+                logger.registrar("No se pudo crear el elemento", "❌", forzar=True)
+            return exito
                 
         except Exception as error:
-            logger.registrar(f"Error procesando correo de {remitente}: {error}", "❌")
+            logger.registrar(f"Error creando elemento para correo de {remitente}: {error}", "❌", forzar=True)
+            return False
 
 
 def main():
@@ -488,40 +912,76 @@ def main():
     
     # Inicializar clientes
     cliente_azure = ClienteAzureDevOps(config["azure_org"], config["azure_project"], config["azure_pat"])
-    procesador_correos = ProcesadorCorreos(config["imap_server"], config["imap_user"], config["imap_pass"])
+    procesador_correos = ProcesadorCorreos(
+        config["imap_server"], config["imap_user"], config["imap_pass"], config["processed_uids_file"]
+    )
+    ejecutor = ThreadPoolExecutor(max_workers=config["azure_workers"])
     
-    while True:
-        try:
-            # Conectar y procesar correos
-            cliente_imap = procesador_correos.conectar()
-            if cliente_imap:
-                # Buscar correos de todos los remitentes monitoreados
-                correos = procesador_correos.buscar_correos_monitoreados(
-                    cliente_imap, config["monitored_senders"]
-                )
+    try:
+        while True:
+            try:
+                # Reutilizar la conexión abierta o reconectar si se perdió
+                cliente_imap = procesador_correos.obtener_cliente()
+                if cliente_imap:
+                    # Buscar correos de todos los remitentes monitoreados
+                    correos = procesador_correos.buscar_correos_monitoreados(
+                        cliente_imap, config["monitored_senders"]
+                    )
                 
-                if correos:
-                    logger.registrar(f"📬 Encontrados {len(correos)} correos nuevos de {len(config['monitored_senders'])} remitentes", "📬")
+                    if correos:
+                        logger.registrar(f"📬 Encontrados {len(correos)} correos nuevos de {len(config['monitored_senders'])} remitentes", "📬")
                     
-                    for id_correo, remitente in correos:
-                        procesador_correos.procesar_correo(
-                            cliente_imap, id_correo, remitente, cliente_azure, logger
-                        )
+                        # Descargar todos los correos en lote antes de procesarlos
+                        mensajes = procesador_correos.fetch_en_lote(cliente_imap, correos)
+                    
+                        # Fase IMAP en serie: imaplib no es seguro entre hilos
+                        pendientes = []
+                        for id_correo in correos:
+                            mensaje = mensajes.get(id_correo)
+                            if mensaje is None:
+                                logger.registrar(f"No se pudo descargar el correo {id_correo.decode()}", "❌", forzar=True)
+                                continue
+                            remitente = procesador_correos.remitente_monitoreado(mensaje, config["monitored_senders"])
+                            pendiente = procesador_correos.procesar_correo(
+                                cliente_imap, id_correo, mensaje, remitente, cliente_azure, logger
+                            )
+                            if pendiente:
+                                pendientes.append(pendiente)
+                        
+                        # Fase Azure DevOps en paralelo sobre la sesión HTTP compartida
+                        resultados = list(ejecutor.map(
+                            lambda pendiente: procesador_correos.crear_elemento_correo(pendiente, cliente_azure, logger),
+                            pendientes
+                        ))
+                        
+                        # Marcar como leídos solo los correos con elemento creado; el resto se reintenta
+                        for pendiente, exito in zip(pendientes, resultados):
+                            if exito:
+                                procesador_correos.marcar_procesado(cliente_imap, pendiente["id_mensaje"])
+                            elif procesador_correos.registrar_fallo(cliente_imap, pendiente["id_mensaje"]):
+                                logger.registrar(
+                                    f"Se descarta el correo de {pendiente['remitente']} tras {MAX_INTENTOS_CREACION} intentos fallidos: {pendiente['titulo']}",
+                                    "❌", forzar=True
+                                )
+                    else:
+                        logger.registrar(f"📭 No hay correos nuevos de {len(config['monitored_senders'])} remitentes monitoreados", "📭")
+                    
+                    # Esperar correo nuevo (IDLE) o el intervalo de verificación
+                    logger.registrar(f"⏰ Esperando correo nuevo (máximo {config['check_interval']} segundos)", "⏰")
+                    logger.flush()
+                    procesador_correos.esperar_novedades(config["check_interval"])
                 else:
-                    logger.registrar(f"📭 No hay correos nuevos de {len(config['monitored_senders'])} remitentes monitoreados", "📭")
-                
-                cliente_imap.close()
-                cliente_imap.logout()
-            else:
-                logger.registrar("❌ No se pudo conectar al servidor IMAP", "❌")
-            
-            # Esperar antes de volver a revisar
-            logger.registrar(f"⏰ Esperando {config['check_interval']} segundos para siguiente verificación", "⏰")
-            time.sleep(config["check_interval"])
-            
-        except Exception as error:
-            logger.registrar(f"❌ Error en el bucle principal: {error}", "❌")
-            time.sleep(config["check_interval"])
+                    espera = procesador_correos.siguiente_espera_reconexion()
+                    logger.registrar(f"❌ No se pudo conectar al servidor IMAP. Reintentando en {espera} segundos", "❌", forzar=True)
+                    time.sleep(espera)
+            
+            except Exception as error:
+                logger.registrar(f"❌ Error en el bucle principal: {error}", "❌", forzar=True)
+                time.sleep(config["check_interval"])
+    finally:
+        ejecutor.shutdown(wait=True)
+        procesador_correos.guardar_uids_procesados()
+        procesador_correos.cerrar()
 
 
 if __name__ == "__main__":